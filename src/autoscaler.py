@@ -0,0 +1,88 @@
+# _*_ coding: utf8 _*_
+
+import math
+from collections import deque
+
+# --- Constantes ---
+# Intervalle entre deux évaluations (en secondes)
+EVALUATION_INTERVAL = 1.0
+
+# Utilisation visée du pool : la taille souhaitée laisse cette marge
+TARGET_UTILIZATION = 0.7
+
+# Hystérésis : on ne réduit que sous ce seuil d'utilisation lissée
+SCALE_DOWN_UTILIZATION = 0.3
+
+# Latence p99 visée (en secondes) de la réception à la réponse au client
+LATENCY_TARGET_P99 = 0.5
+
+# Délais de stabilisation (en secondes)
+SCALE_UP_COOLDOWN = 2       # Entre deux agrandissements
+SCALE_DOWN_COOLDOWN = 30    # Après tout changement, avant une réduction
+IDLE_RETIRE_DELAY = 30      # Inactivité minimale d'un worker avant son retrait
+
+# Lissage exponentiel de l'utilisation (poids de la dernière mesure)
+UTILIZATION_SMOOTHING = 0.3
+
+# Fenêtre glissante des latences (durée en secondes, nombre max d'échantillons)
+LATENCY_WINDOW = 30
+LATENCY_SAMPLES = 2048
+
+
+class Autoscaler:
+    """Décide de la taille du pool de workers à partir de la profondeur de
+    file, de l'utilisation et de la latence p99 observées"""
+
+    def __init__(self, min_workers, max_workers):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.utilization = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.last_scale_up = float("-inf")
+        self.last_change = float("-inf")
+
+    def record_latency(self, now, latency):
+        """Enregistre la latence d'une requête terminée"""
+        self.latencies.append((now, latency))
+
+    def p99(self, now):
+        """Latence p99 sur la fenêtre glissante (0 sans échantillon)"""
+        while self.latencies and self.latencies[0][0] < now - LATENCY_WINDOW:
+            self.latencies.popleft()
+        if not self.latencies:
+            return 0.0
+        values = sorted(latency for _, latency in self.latencies)
+        return values[min(len(values) - 1, math.ceil(0.99 * len(values)) - 1)]
+
+    def evaluate(self, now, workers, utilization, queue_depth, retirable):
+        """Retourne la variation souhaitée du nombre de workers
+        (positive : à démarrer, -1 : un worker inactif à retirer, 0 : rien).
+        utilization est la part du temps des workers passée à traiter des
+        requêtes depuis l'évaluation précédente, retirable le nombre de
+        workers inactifs depuis IDLE_RETIRE_DELAY"""
+        self.utilization += UTILIZATION_SMOOTHING * (utilization - self.utilization)
+        p99 = self.p99(now)
+
+        # Taille nécessaire pour absorber la charge courante avec une marge :
+        # nombre moyen de workers occupés sur l'intervalle, plus la file
+        desired = math.ceil((utilization * workers + queue_depth) / TARGET_UTILIZATION)
+        if p99 > LATENCY_TARGET_P99 and queue_depth:
+            desired = max(desired, workers + 1)
+        desired = max(self.min_workers, min(self.max_workers, desired))
+
+        if desired > workers:
+            if now - self.last_scale_up < SCALE_UP_COOLDOWN:
+                return 0
+            self.last_scale_up = self.last_change = now
+            return desired - workers
+
+        if (workers > self.min_workers
+                and retirable
+                and queue_depth == 0
+                and self.utilization < SCALE_DOWN_UTILIZATION
+                and p99 <= LATENCY_TARGET_P99
+                and now - self.last_change >= SCALE_DOWN_COOLDOWN):
+            self.last_change = now
+            return -1
+
+        return 0
@@ -0,0 +1,117 @@
+# _*_ coding: utf8 _*_
+
+import json
+import os
+import re
+import signal
+
+# --- Constantes ---
+# Groupe utilisé quand aucune configuration n'est fournie
+DEFAULT_INSTANCE = "default"
+DEFAULT_PORT = 2222
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 4
+
+# Signal de réponse au heartbeat du watchdog (temps réel : les envois
+# simultanés de plusieurs processus sont mis en file au lieu d'être fusionnés)
+HEARTBEAT_REPLY_SIGNAL = signal.SIGRTMIN
+
+# Variable d'environnement transmettant le PID du watchdog aux processus surveillés
+ENV_WATCHDOG_PID = "OSPS_WATCHDOG_PID"
+
+# Noms de groupe autorisés : utilisés tels quels dans les chemins /tmp et le nom du segment partagé
+GROUP_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+MAX_PORT = 65535
+
+
+# --- Chemins propres à chaque instance ---
+def dispatcher_pid_file(instance):
+    """Chemin du fichier PID du dispatcher d'un groupe"""
+    return f"/tmp/dispatcher-{instance}.pid"
+
+
+def worker_pid_file(instance, index):
+    """Chemin du fichier PID d'un worker d'un groupe"""
+    return f"/tmp/worker-{instance}-{index}.pid"
+
+
+def tube_paths(instance, index):
+    """Chemins des tubes nommés (dispatcher → worker, worker → dispatcher)"""
+    return f"/tmp/dwtube-{instance}-{index}", f"/tmp/wdtube-{instance}-{index}"
+
+
+def shm_name(instance):
+    """Nom du segment de mémoire partagée d'un groupe"""
+    return f"shared_memory_{instance}"
+
+
+def worker_port(port, index):
+    """Port d'écoute d'un worker : les ports suivant celui du dispatcher"""
+    return port + 1 + index
+
+
+# --- Heartbeat ---
+def heartbeat_target():
+    """PID auquel répondre au heartbeat : le watchdog s'il est connu, sinon le parent"""
+    try:
+        return int(os.environ[ENV_WATCHDOG_PID])
+    except (KeyError, ValueError):
+        return os.getppid()
+
+
+# --- Chargement des groupes ---
+def is_integer(value):
+    """Vrai pour un entier JSON (un booléen est un int en Python : l'exclure)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def make_group(name=DEFAULT_INSTANCE, port=DEFAULT_PORT,
+               min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS):
+    """Construit la description d'un groupe dispatcher + pool de workers"""
+    return {"name": name, "port": port, "min_workers": min_workers, "max_workers": max_workers}
+
+
+def load_groups(path=None):
+    """Charge la liste des groupes depuis un fichier JSON (liste d'objets
+    {"name", "port", "min_workers", "max_workers"}), ou retourne le groupe par défaut.
+    Lève ValueError si la configuration est invalide."""
+    if path is None:
+        return [make_group()]
+
+    with open(path, "r") as f:
+        entries = json.load(f)
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("la configuration doit être une liste non vide de groupes")
+
+    groups = []
+    names = set()
+    used_ports = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError("chaque groupe doit être un objet")
+        try:
+            group = make_group(**entry)
+        except TypeError as exception:
+            raise ValueError(f"groupe invalide : {exception}")
+
+        if not isinstance(group["name"], str) or not GROUP_NAME_PATTERN.fullmatch(group["name"]):
+            raise ValueError(f"groupe {group['name']!r} : nom invalide (lettres, chiffres, '_' et '-' uniquement)")
+        if (not is_integer(group["min_workers"]) or not is_integer(group["max_workers"])
+                or not 1 <= group["min_workers"] <= group["max_workers"]):
+            raise ValueError(f"groupe {group['name']} : bornes du nombre de workers invalides")
+        # Le dernier worker écoute sur port + max_workers
+        if not is_integer(group["port"]) or not 1 <= group["port"] <= MAX_PORT - group["max_workers"]:
+            raise ValueError(f"groupe {group['name']} : port invalide ({group['port']!r})")
+        if group["name"] in names:
+            raise ValueError(f"groupe {group['name']} défini plusieurs fois")
+
+        ports = {group["port"]} | {worker_port(group["port"], i) for i in range(group["max_workers"])}
+        if ports & used_ports:
+            raise ValueError(f"groupe {group['name']} : ports en conflit avec un autre groupe")
+
+        names.add(group["name"])
+        used_ports |= ports
+        groups.append(group)
+
+    return groups
@@ -1,13 +1,21 @@
 #! /usr/bin/env python3
 # _*_ coding: utf8 _*_
 
+import errno
 import os
+import selectors
 import signal
 import socket
 import sys
 import time
+from collections import deque
+from itertools import count
 from multiprocessing import Process, shared_memory
 
+import config
+import profiler
+from autoscaler import Autoscaler, EVALUATION_INTERVAL, IDLE_RETIRE_DELAY
+
 # --- Constantes ---
 # Couleurs pour les messages
 ERROR = '\033[91m'
@@ -17,28 +25,46 @@ RESET = '\033[0m'
 
 # Configuration réseau
 HOST = '127.0.0.1'
-PORT = 2222
-
-# Chemins des tubes nommés
-TUBE_D_W = "/tmp/dwtube1"
-TUBE_W_D = "/tmp/wdtube1"
-
-# Chemin du fichier PID
-DISPATCHER_PID_FILE = "/tmp/dispatcher.pid"
 
 # Configuration mémoire partagée
-SHM_NAME = 'shared_memory'
 SHM_SIZE = 10
 INITIAL_DATA = bytearray([74, 73, 72, 71, 70, 69, 68, 67, 66, 65])
 
+# Délais de gestion du pool de workers (en secondes)
+POLL_INTERVAL = 0.1          # Attente maximale quand un worker change d'état
+WORKER_START_TIMEOUT = 10    # Délai accordé à un worker pour répondre au ping initial
+RETIRE_TIMEOUT = 5           # Délai accordé à un worker retiré pour s'arrêter
+TERMINATE_TIMEOUT = 2        # Délai après SIGTERM avant de tuer un worker
+ACCEPT_RETRY_DELAY = 1       # Pause des connexions quand les descripteurs sont épuisés
+
+# Attente avant de réutiliser l'indice d'un worker qui n'a pas démarré :
+# doublée à chaque échec consécutif, dans la limite du maximum (en secondes)
+START_BACKOFF_INITIAL = 0.5
+START_BACKOFF_MAX = 30
+
+# Nombre de workers qu'une requête peut voir s'arrêter avant d'être abandonnée
+MAX_REQUEST_ATTEMPTS = 2
+
+# Tampons des clients (en octets)
+MAX_REQUEST_SIZE = 1024 * 1024   # Requête la plus longue acceptée
+MAX_CLIENT_OUTPUT = 1024 * 1024  # Réponses en attente au-delà desquelles le client n'est plus lu
+
 # Variable globale pour gérer l'arrêt propre
 shutdown_requested = False
 
+# Sélecteur des descripteurs surveillés par la boucle (socket d'écoute,
+# clients et tubes des workers), inscrits et retirés au fil de l'eau
+selector = None
+
+# Échéance de la reprise des connexions, suspendues faute de descripteurs (None : actives)
+accept_paused_until = None
+accept_exhausted = False
+
 
 # --- Gestion des signaux ---
 def handle_sigusr1(sig, frame):
-    """Gestionnaire pour le signal SIGUSR1"""
-    os.kill(os.getppid(), signal.SIGUSR2)
+    """Gestionnaire pour le signal SIGUSR1 (heartbeat du watchdog)"""
+    os.kill(config.heartbeat_target(), config.HEARTBEAT_REPLY_SIGNAL)
 
 def handle_sigint(sig, frame):
     """Gestionnaire pour SIGINT (Ctrl+C)"""
@@ -50,37 +76,49 @@ def handle_sigint(sig, frame):
 signal.signal(signal.SIGUSR1, handle_sigusr1)
 signal.signal(signal.SIGINT, handle_sigint)
 signal.signal(signal.SIGTERM, handle_sigint)
+# Sans watchdog, les workers répondent au dispatcher : ignorer leur réponse
+signal.signal(config.HEARTBEAT_REPLY_SIGNAL, signal.SIG_IGN)
 
 
 # --- Fonctions utilitaires ---
-def setup_named_pipes():
-    """Configure les tubes nommés"""
-    for tube in (TUBE_D_W, TUBE_W_D):
+def setup_named_pipes(instance, index):
+    """Configure les tubes nommés d'un worker"""
+    for tube in config.tube_paths(instance, index):
         if not os.path.exists(tube):
             os.mkfifo(tube, 0o600)
 
-    print(f"[Dispatcher] - INFO : Tubes nommés configurés")
+    print(f"[Dispatcher] - INFO : Tubes nommés du worker {index} configurés")
+
+
+def cleanup_named_pipes(instance, index):
+    """Supprime les tubes nommés d'un worker"""
+    for tube in config.tube_paths(instance, index):
+        try:
+            if os.path.exists(tube):
+                os.unlink(tube)
+        except:
+            pass
 
 
-def setup_network():
+def setup_network(port):
     """Configure et retourne le socket réseau"""
     try:
         dispatcher_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         dispatcher_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        dispatcher_socket.bind((HOST, PORT))
+        dispatcher_socket.bind((HOST, port))
         dispatcher_socket.listen()
-        print(f"[Dispatcher] - INFO : Dispatcher en écoute sur {HOST}:{PORT}")
+        print(f"[Dispatcher] - INFO : Dispatcher en écoute sur {HOST}:{port}")
         return dispatcher_socket
     except OSError as exception:
         print(f"{ERROR}[Dispatcher] - ERREUR : Une erreur est survenue au moment d'attacher le port : {exception}{RESET}")
-        print(f"{ERROR}[Dispatcher] - ERREUR : Le port {PORT} est peut-être utilisé par un autre programme{RESET}")
+        print(f"{ERROR}[Dispatcher] - ERREUR : Le port {port} est peut-être utilisé par un autre programme{RESET}")
         return None
 
 
-def setup_shared_memory():
+def setup_shared_memory(instance):
     """Configure et retourne le segment de mémoire partagée"""
     try:
-        shm_segment = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)
+        shm_segment = shared_memory.SharedMemory(name=config.shm_name(instance), create=True, size=SHM_SIZE)
         print('[Dispatcher] - INFO : Nom du segment mémoire partagée :', shm_segment.name)
         print('[Dispatcher] - INFO : Taille du segment mémoire partagée en octets :', len(shm_segment.buf))
 
@@ -92,134 +130,614 @@ def setup_shared_memory():
         return None
 
 
-def start_worker_process():
-    """Démarre le processus worker"""
+def run_worker(instance, index, port, inherited_fds):
+    """Point d'entrée du processus worker n°index"""
+    # Le fork duplique les descripteurs du dispatcher : fermer ceux des autres
+    # workers et des clients pour que la fermeture d'un tube soit bien vue
+    for fd in inherited_fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    # Import dans le processus fils pour ne pas installer les gestionnaires
+    # de signaux du worker dans le dispatcher
     from worker import main as worker_main
+    return worker_main(instance, index, config.worker_port(port, index))
+
 
-    worker_process = Process(target=worker_main)
+def start_worker_process(instance, index, port, inherited_fds=()):
+    """Démarre le processus worker n°index"""
+    worker_process = Process(target=run_worker, args=(instance, index, port, list(inherited_fds)))
     worker_process.start()
-    print(f"{SUCCESS}[Dispatcher] - SUCCESS : Worker démarré (PID: {worker_process.pid}){RESET}")
+    print(f"{SUCCESS}[Dispatcher] - SUCCESS : Worker {index} démarré (PID: {worker_process.pid}){RESET}")
     return worker_process
 
 
-def handle_worker_communication(worker_process):
-    """Gère la communication avec le worker via les tubes nommés"""
-    global shutdown_requested
+def stop_worker_process(worker_process, index):
+    """Attend la fin d'un worker, en forçant son arrêt si nécessaire"""
+    if worker_process.is_alive():
+        print(f"[Dispatcher] - INFO : Attente de la fermeture du worker {index}...")
+        worker_process.join(timeout=5)
+        if worker_process.is_alive():
+            print(f"{WARNING}Dispatcher - WARNING : Forcer l'arrêt du worker {index}...{RESET}")
+            worker_process.terminate()
+            worker_process.join(timeout=2)
+            if worker_process.is_alive():
+                worker_process.kill()
+
+
+# --- Pool de workers ---
+def record_start_failure(start_failures, index, now):
+    """Enregistre l'échec de démarrage d'un worker et diffère la réutilisation de son indice"""
+    failures = start_failures.get(index, (0, 0))[0] + 1
+    delay = min(START_BACKOFF_MAX, START_BACKOFF_INITIAL * 2 ** (failures - 1))
+    start_failures[index] = (failures, now + delay)
+    print(f"{WARNING}[Dispatcher] - WARNING : Échec de démarrage n°{failures} du worker {index}, "
+          f"nouvel essai dans {delay:.1f}s{RESET}")
+
 
-    fifo_out = None
-    fifo_in = None
+def next_start_time(start_failures, now):
+    """Prochaine échéance d'attente après un échec de démarrage (None si aucune)"""
+    pending = [retry_at for _, retry_at in start_failures.values() if retry_at > now]
+    return min(pending, default=None)
+
+
+def spawn_worker(instance, port, pool, inherited_fds, start_failures, max_workers):
+    """Démarre un worker sur le premier indice libre et l'ajoute au pool. Les
+    indices en attente après un échec de démarrage sont évités (None si aucun n'est disponible)"""
+    now = time.monotonic()
+    used = {worker["index"] for worker in pool}
+    available = [i for i in range(max_workers)
+                 if i not in used and start_failures.get(i, (0, 0))[1] <= now]
+    if not available:
+        return None
+    index = available[0]
 
     try:
-        # Donner du temps au worker pour démarrer et se préparer
-        print("[Dispatcher] - INFO : Attente du démarrage du worker...")
-        time.sleep(3)  # Attendre 3 secondes pour que le worker se prépare
+        setup_named_pipes(instance, index)
+    except OSError as exception:
+        print(f"{ERROR}[Dispatcher] - ERREUR : Impossible de créer les tubes du worker {index} : {exception}{RESET}")
+        record_start_failure(start_failures, index, now)
+        return None
 
-        if shutdown_requested:
-            print(f"{WARNING}[Dispatcher] - INFO : Arrêt demandé pendant l'attente du worker{RESET}")
+    worker_process = start_worker_process(instance, index, port, inherited_fds)
+
+    # Ouverture non bloquante du tube de réponse : le worker ouvrira
+    # l'extrémité en écriture une fois prêt
+    worker = {
+        "index": index,
+        "process": worker_process,
+        "fd_in": None,
+        "fd_out": None,
+        "buffer": b"",
+        "state": "starting",
+        "request": None,
+        "since": now,
+        "ready": False,
+        "busy_from": now,   # Début du temps occupé non encore compté par l'autoscaler
+        "busy_time": 0.0,   # Temps occupé depuis la dernière évaluation (en secondes)
+    }
+    pool.append(worker)
+
+    try:
+        worker["fd_in"] = os.open(config.tube_paths(instance, index)[1], os.O_RDONLY | os.O_NONBLOCK)
+        selector.register(worker["fd_in"], selectors.EVENT_READ, worker)
+    except OSError as exception:
+        print(f"{ERROR}[Dispatcher] - ERREUR : Impossible d'ouvrir le tube du worker {index} : {exception}{RESET}")
+        close_worker_fds(worker)
+        worker["state"] = "dead"  # Arrêté et retiré du pool par reap_workers
+
+    return worker
+
+
+def connect_worker(instance, worker):
+    """Ouvre le tube vers un worker qui démarre et lui envoie le ping de contrôle"""
+    try:
+        fd_out = os.open(config.tube_paths(instance, worker["index"])[0], os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as exception:
+        if exception.errno == errno.ENXIO:
+            return  # Le worker n'a pas encore ouvert le tube en lecture
+        print(f"{ERROR}[Dispatcher] - ERREUR : Impossible d'ouvrir le tube du worker {worker['index']} : {exception}{RESET}")
+        worker["state"] = "dead"
+        return
+
+    os.set_blocking(fd_out, True)
+    worker["fd_out"] = fd_out
+    worker["state"] = "handshake"
+    try:
+        write_to_worker(worker, "ping")
+    except OSError:
+        # Worker arrêté pendant la poignée de main
+        worker["state"] = "dead"
+
+
+def write_to_worker(worker, message):
+    """Écrit une ligne dans le tube d'un worker"""
+    os.write(worker["fd_out"], (message + "\n").encode())
+
+
+def unwatch(fileobj):
+    """Retire un descripteur du sélecteur, s'il y est inscrit"""
+    try:
+        selector.unregister(fileobj)
+    except (KeyError, ValueError):
+        pass
+
+
+def release_descriptor():
+    """Signale la libération d'un descripteur : les connexions suspendues reprennent"""
+    global accept_paused_until
+    if accept_paused_until is not None:
+        accept_paused_until = 0
+
+
+def close_worker_input(worker):
+    """Ferme le tube de réponse d'un worker et cesse de le surveiller"""
+    if worker["fd_in"] is not None:
+        unwatch(worker["fd_in"])
+        try:
+            os.close(worker["fd_in"])
+        except OSError:
+            pass
+        worker["fd_in"] = None
+        release_descriptor()
+
+
+def close_worker_fds(worker):
+    """Ferme les descripteurs des tubes d'un worker"""
+    close_worker_input(worker)
+    if worker["fd_out"] is not None:
+        try:
+            os.close(worker["fd_out"])
+        except OSError:
+            pass
+        worker["fd_out"] = None
+        release_descriptor()
+
+
+def retire_worker(worker, now):
+    """Demande à un worker inactif de s'arrêter proprement"""
+    print(f"{WARNING}[Dispatcher] - INFO : Retrait du worker {worker['index']} (inactif){RESET}")
+    try:
+        write_to_worker(worker, "STOP")
+    except OSError:
+        pass
+    worker["state"] = "retiring"
+    worker["since"] = now
+
+
+def reply_to_client(clients, request, reply):
+    """Ajoute une réponse au tampon de sortie du client à l'origine de la requête"""
+    client_socket = request["client"]
+    if client_socket not in clients:
+        return
+    clients[client_socket]["output"] += reply + b"\n"
+    profiler.mark(request["trace"], "client_reply")
+    flush_client(clients, client_socket)
+
+
+def send_reply(clients, request, reply, now, scaler):
+    """Renvoie la réponse d'un worker au client et enregistre sa latence"""
+    profiler.mark(request["trace"], "reply")
+    scaler.record_latency(now, now - request["enqueued_at"])
+    reply_to_client(clients, request, reply)
+    profiler.finish(request["trace"])
+
+
+def close_client(clients, client_socket):
+    """Ferme la connexion d'un client"""
+    clients.pop(client_socket, None)
+    unwatch(client_socket)
+    try:
+        client_socket.close()
+    except OSError:
+        pass
+    release_descriptor()
+
+
+def handle_worker_output(worker, clients, scaler, start_failures, now):
+    """Lit les réponses d'un worker ; retourne False si son tube est fermé"""
+    try:
+        data = os.read(worker["fd_in"], 65536)
+    except BlockingIOError:
+        return True
+    except OSError:
+        data = b""
+    if not data:
+        return False
+
+    worker["buffer"] += data
+    while b"\n" in worker["buffer"]:
+        line, worker["buffer"] = worker["buffer"].split(b"\n", 1)
+        line = line.strip()
+
+        if worker["state"] == "handshake":
+            if line == b"pong":
+                print(f"{SUCCESS}[Dispatcher] - SUCCESS : Worker {worker['index']} prêt{RESET}")
+                start_failures.pop(worker["index"], None)
+                worker["ready"] = True
+                worker["state"] = "idle"
+                worker["since"] = now
+        elif worker["state"] == "busy":
+            # Réponse encadrée : "REP <id> <réponse>"
+            parts = line.split(b" ", 2)
+            if len(parts) < 2 or parts[0] != b"REP" or parts[1] != str(worker["request"]["id"]).encode():
+                print(f"{WARNING}[Dispatcher] - WARNING : Réponse inattendue du worker {worker['index']} : {line!r}{RESET}")
+                continue
+            send_reply(clients, worker["request"], parts[2] if len(parts) == 3 else b"", now, scaler)
+            worker["request"] = None
+            worker["state"] = "idle"
+            worker["since"] = now
+            worker["busy_time"] += now - worker["busy_from"]
+
+    return True
+
+
+def dispatch_requests(pool, request_queue):
+    """Attribue les requêtes en attente aux workers inactifs"""
+    for worker in pool:
+        if not request_queue:
             return
+        if worker["state"] != "idle":
+            continue
 
-        # Vérifier que le worker est encore vivant
-        if not worker_process.is_alive():
-            print(f"{ERROR}[Dispatcher] - ERREUR : Le worker s'est arrêté prématurément{RESET}")
+        request = request_queue.popleft()
+        try:
+            # Les requêtes sont encadrées pour ne jamais être prises pour
+            # une commande de contrôle (ping, STOP)
+            write_to_worker(worker, f"REQ {request['id']} {request['payload'].decode(errors='replace')}")
+        except OSError:
+            # Worker perdu avant réception : la requête sera reprise par un autre worker
+            request_queue.appendleft(request)
+            worker["state"] = "dead"
+            continue
+        profiler.mark(request["trace"], "channel_write")
+        worker["request"] = request
+        worker["state"] = "busy"
+        worker["since"] = worker["busy_from"] = time.monotonic()
+
+
+def reap_workers(instance, pool, clients, request_queue, start_failures, now):
+    """Retire du pool les workers terminés, retirés ou bloqués au démarrage.
+    Un worker à forcer reçoit SIGTERM puis reste dans le pool (état terminating)
+    jusqu'à sa fin, pour ne pas bloquer la boucle en attendant"""
+    for worker in list(pool):
+        alive = worker["process"].is_alive()
+        state = worker["state"]
+
+        if state == "terminating":
+            if alive:
+                if now - worker["since"] >= TERMINATE_TIMEOUT:
+                    print(f"{WARNING}Dispatcher - WARNING : Le worker {worker['index']} ignore SIGTERM, arrêt forcé{RESET}")
+                    worker["process"].kill()
+                    worker["since"] = now
+                continue
+        elif alive and state == "retiring":
+            if now - worker["since"] < RETIRE_TIMEOUT:
+                continue
+            print(f"{WARNING}Dispatcher - WARNING : Forcer l'arrêt du worker {worker['index']}...{RESET}")
+        elif alive and state in ("starting", "handshake"):
+            if now - worker["since"] < WORKER_START_TIMEOUT:
+                continue
+            print(f"{ERROR}[Dispatcher] - ERREUR : Le worker {worker['index']} ne démarre pas{RESET}")
+        elif alive and state != "dead":
+            continue
+        elif state != "retiring":
+            print(f"{ERROR}[Dispatcher] - ERREUR : Le worker {worker['index']} s'est arrêté{RESET}")
+
+        # Reprendre la requête en cours pour la confier à un autre worker,
+        # sauf si elle a déjà fait tomber trop de workers
+        request = worker["request"]
+        worker["request"] = None
+        if request is not None:
+            request["attempts"] += 1
+            if request["attempts"] < MAX_REQUEST_ATTEMPTS:
+                request_queue.appendleft(request)
+            else:
+                print(f"{ERROR}[Dispatcher] - ERREUR : Requête {request['id']} abandonnée après {request['attempts']} échecs{RESET}")
+                reply_to_client(clients, request, b"ERR worker perdu")
+                profiler.finish(request["trace"])
+
+        # Un worker perdu avant sa poignée de main n'est pas relancé aussitôt sur le même indice
+        if not worker["ready"]:
+            record_start_failure(start_failures, worker["index"], now)
+
+        close_worker_fds(worker)
+        if alive:
+            worker["process"].terminate()
+            worker["state"] = "terminating"
+            worker["since"] = now
+            continue
+
+        worker["process"].join()
+        cleanup_named_pipes(instance, worker["index"])
+        pool.remove(worker)
+
+
+def get_inherited_fds(dispatcher_socket, clients, pool):
+    """Descripteurs du dispatcher qu'un nouveau worker doit fermer"""
+    fds = [selector.fileno(), dispatcher_socket.fileno()] + [client_socket.fileno() for client_socket in clients]
+    for worker in pool:
+        fds += [worker[key] for key in ("fd_in", "fd_out") if worker[key] is not None]
+    return fds
+
+
+def collect_busy_time(pool, now):
+    """Retourne le temps passé par les workers à traiter des requêtes depuis
+    le dernier appel, y compris la part écoulée des requêtes en cours"""
+    busy_time = 0.0
+    for worker in pool:
+        if worker["state"] == "busy":
+            worker["busy_time"] += now - worker["busy_from"]
+            worker["busy_from"] = now
+        busy_time += worker["busy_time"]
+        worker["busy_time"] = 0.0
+    return busy_time
+
+
+def autoscale(instance, port, dispatcher_socket, clients, pool, request_queue, scaler, start_failures,
+              now, interval):
+    """Ajuste la taille du pool selon la décision de l'autoscaler (interval :
+    durée écoulée depuis l'évaluation précédente)"""
+    active = [worker for worker in pool if worker["state"] not in ("retiring", "terminating")]
+    busy = sum(1 for worker in active if worker["state"] == "busy")
+    retirable = [worker for worker in active
+                 if worker["state"] == "idle" and now - worker["since"] >= IDLE_RETIRE_DELAY]
+
+    # Part du temps des workers passée à traiter des requêtes, et non le
+    # nombre de workers occupés à l'instant de l'évaluation
+    busy_time = collect_busy_time(pool, now)
+    if active and interval > 0:
+        utilization = min(1.0, busy_time / (len(active) * interval))
+    else:
+        utilization = 1.0
+
+    delta = scaler.evaluate(now, len(active), utilization, len(request_queue), len(retirable))
+
+    if delta > 0:
+        count = min(delta, scaler.max_workers - len(pool))
+        if count > 0:
+            print(f"{WARNING}[Dispatcher] - INFO : Ajout de {count} worker(s) "
+                  f"(file : {len(request_queue)}, occupés : {busy}/{len(active)}, utilisation : {utilization:.0%}){RESET}")
+        for _ in range(count):
+            spawn_worker(instance, port, pool, get_inherited_fds(dispatcher_socket, clients, pool),
+                         start_failures, scaler.max_workers)
+    elif delta < 0:
+        retire_worker(min(retirable, key=lambda worker: worker["since"]), now)
+
+
+# --- Clients ---
+def pause_accept(dispatcher_socket, exception):
+    """Cesse de surveiller le socket d'écoute jusqu'à la libération d'un
+    descripteur ou ACCEPT_RETRY_DELAY : la connexion en attente le laisserait
+    lisible et la boucle tournerait à vide"""
+    global accept_paused_until, accept_exhausted
+    unwatch(dispatcher_socket)
+    accept_paused_until = time.monotonic() + ACCEPT_RETRY_DELAY
+    if not accept_exhausted:
+        print(f"{WARNING}[Dispatcher] - WARNING : Connexions suspendues : {exception}{RESET}")
+        accept_exhausted = True
+
+
+def resume_accept(dispatcher_socket):
+    """Surveille de nouveau le socket d'écoute"""
+    global accept_paused_until
+    selector.register(dispatcher_socket, selectors.EVENT_READ)
+    accept_paused_until = None
+
+
+def accept_clients(dispatcher_socket, clients):
+    """Accepte les connexions clientes en attente"""
+    global accept_exhausted
+    while True:
+        try:
+            client_socket, address = dispatcher_socket.accept()
+        except BlockingIOError:
+            return
+        except ConnectionAbortedError:
+            continue  # Connexion abandonnée par le client avant son acceptation
+        except OSError as exception:
+            if exception.errno in (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM):
+                # La connexion reste dans la file d'attente : suspendre l'écoute
+                pause_accept(dispatcher_socket, exception)
+            else:
+                print(f"{WARNING}[Dispatcher] - WARNING : Connexion refusée : {exception}{RESET}")
             return
 
-        print("[Dispatcher] - INFO : Ouverture des tubes de communication...")
-        fifo_out = open(TUBE_D_W, "w")
-        fifo_in = open(TUBE_W_D, "r")
-
-        print("[Dispatcher] - INFO : Début de la communication ping-pong...")
-
-        # Communication ping-pong
-        N = 5
-        for i in range(N):
-            if shutdown_requested or not worker_process.is_alive():
-                break
-
-            print(f"[Dispatcher] → ping {i}")
-            try:
-                fifo_out.write("ping\n")
-                fifo_out.flush()
-            except (BrokenPipeError, OSError) as e:
-                if shutdown_requested:
-                    print(f"{WARNING}[Dispatcher] - INFO : Tube fermé pendant l'arrêt{RESET}")
-                else:
-                    print(f"{ERROR}[Dispatcher] - ERREUR : Tube cassé lors de l'écriture: {e}{RESET}")
-                break
-
-            # Lecture avec gestion d'erreur
-            try:
-                reply = fifo_in.readline().strip()
-                if reply:
-                    print(f"Réponse worker : {reply}")
-                else:
-                    print(f"{WARNING}[Dispatcher] - WARNING : Réponse vide du worker{RESET}")
-            except Exception as e:
-                if shutdown_requested:
-                    print(f"{WARNING}[Dispatcher] - INFO : Lecture interrompue pendant l'arrêt{RESET}")
-                else:
-                    print(f"{ERROR}[Dispatcher] - ERREUR : Erreur de lecture depuis le worker: {e}{RESET}")
-                break
-
-        # Arrêter le worker proprement
-        if fifo_out and not shutdown_requested and worker_process.is_alive():
-            try:
-                print("[Dispatcher] - INFO : Envoi de la commande STOP au worker...")
-                fifo_out.write("STOP\n")
-                fifo_out.flush()
-                time.sleep(1)  # Laisser le temps au worker de traiter STOP
-            except (BrokenPipeError, OSError):
-                print(f"{WARNING}Dispatcher - INFO : Worker déjà arrêté (tube fermé){RESET}")
-
-        # Attendre la fin du worker
-        if worker_process.is_alive():
-            print("[Dispatcher] - INFO : Attente de la fermeture du worker...")
-            worker_process.join(timeout=5)
-            if worker_process.is_alive():
-                print(f"{WARNING}Dispatcher - WARNING : Forcer l'arrêt du worker...{RESET}")
-                worker_process.terminate()
-                worker_process.join(timeout=2)
-                if worker_process.is_alive():
-                    worker_process.kill()
+        if accept_exhausted:
+            print(f"{SUCCESS}[Dispatcher] - INFO : Connexions reprises{RESET}")
+            accept_exhausted = False
+        client_socket.setblocking(False)
+        clients[client_socket] = {"input": b"", "output": bytearray()}
+        selector.register(client_socket, selectors.EVENT_READ)
+
+
+def update_client(clients, client_socket):
+    """Surveille l'écriture tant que des réponses sont en attente, et
+    suspend la lecture d'un client qui ne lit plus ses réponses"""
+    output = clients[client_socket]["output"]
+    events = selectors.EVENT_WRITE if output else 0
+    if len(output) < MAX_CLIENT_OUTPUT:
+        events |= selectors.EVENT_READ
+    selector.modify(client_socket, events)
+
+
+def flush_client(clients, client_socket):
+    """Envoie au client ce que son socket accepte de son tampon de sortie"""
+    output = clients[client_socket]["output"]
+    try:
+        sent = client_socket.send(output)
+    except BlockingIOError:
+        sent = 0
+    except OSError:
+        close_client(clients, client_socket)
+        return
+    del output[:sent]
+    update_client(clients, client_socket)
+
+
+def read_client(clients, client_socket, request_queue, request_ids):
+    """Lit les requêtes d'un client (une par ligne) et les met en file"""
+    try:
+        data = client_socket.recv(65536)
+    except BlockingIOError:
+        return
+    except OSError:
+        data = b""
+    if not data:
+        close_client(clients, client_socket)
+        return
+
+    client = clients[client_socket]
+    client["input"] += data
+    while b"\n" in client["input"]:
+        line, client["input"] = client["input"].split(b"\n", 1)
+        line = line.strip()
+        if line:
+            request_id = next(request_ids)
+            request_queue.append({
+                "id": request_id,
+                "client": client_socket,
+                "payload": line,
+                "enqueued_at": time.monotonic(),
+                "trace": profiler.new_trace("request", request_id),
+                "attempts": 0,
+            })
+
+    if len(client["input"]) > MAX_REQUEST_SIZE:
+        print(f"{WARNING}[Dispatcher] - WARNING : Requête trop longue, client déconnecté{RESET}")
+        close_client(clients, client_socket)
+
+
+def handle_worker_communication(instance, port, dispatcher_socket, pool, min_workers, max_workers):
+    """Répartit les requêtes des clients sur le pool de workers et ajuste sa taille,
+    retourne False si la boucle s'est arrêtée sur une erreur"""
+    global shutdown_requested, selector, accept_paused_until, accept_exhausted
+
+    selector = selectors.DefaultSelector()
+    accept_paused_until = None
+    accept_exhausted = False
+    clients = {}
+    request_queue = deque()
+    request_ids = count(1)
+    scaler = Autoscaler(min_workers, max_workers)
+    start_failures = {}  # indice → (échecs de démarrage consécutifs, réutilisation possible à partir de)
+    last_evaluation = time.monotonic()
+    next_evaluation = last_evaluation + EVALUATION_INTERVAL
+
+    try:
+        dispatcher_socket.setblocking(False)
+        selector.register(dispatcher_socket, selectors.EVENT_READ)
+        print("[Dispatcher] - INFO : Début du traitement des requêtes...")
+
+        while not shutdown_requested:
+            now = time.monotonic()
+
+            if accept_paused_until is not None and now >= accept_paused_until:
+                resume_accept(dispatcher_socket)
+
+            # Remplacer les workers perdus pour garder le minimum
+            reap_workers(instance, pool, clients, request_queue, start_failures, now)
+            active = [worker for worker in pool if worker["state"] not in ("retiring", "terminating")]
+            for _ in range(min(min_workers - len(active), max_workers - len(pool))):
+                spawn_worker(instance, port, pool, get_inherited_fds(dispatcher_socket, clients, pool),
+                             start_failures, max_workers)
+
+            for worker in pool:
+                if worker["state"] == "starting":
+                    connect_worker(instance, worker)
+
+            dispatch_requests(pool, request_queue)
+
+            if now >= next_evaluation:
+                autoscale(instance, port, dispatcher_socket, clients, pool, request_queue, scaler, start_failures,
+                          now, now - last_evaluation)
+                last_evaluation = now
+                next_evaluation = now + EVALUATION_INTERVAL
+
+            # Attendre une connexion, une requête, une réponse ou la prochaine évaluation
+            if any(worker["state"] not in ("idle", "busy") for worker in pool):
+                timeout = POLL_INTERVAL
+            else:
+                timeout = max(0.0, next_evaluation - now)
+            retry_at = next_start_time(start_failures, now)
+            if retry_at is not None:
+                timeout = min(timeout, retry_at - now)
+            if accept_paused_until is not None:
+                timeout = max(0.0, min(timeout, accept_paused_until - now))
+            events = selector.select(timeout)
+
+            now = time.monotonic()
+            for key, mask in events:
+                worker = key.data
+                if key.fileobj is dispatcher_socket:
+                    accept_clients(dispatcher_socket, clients)
+                elif worker is None:
+                    # Client éventuellement fermé par un événement précédent
+                    if mask & selectors.EVENT_WRITE and key.fileobj in clients:
+                        flush_client(clients, key.fileobj)
+                    if mask & selectors.EVENT_READ and key.fileobj in clients:
+                        read_client(clients, key.fileobj, request_queue, request_ids)
+                elif worker["fd_in"] == key.fd:
+                    if not handle_worker_output(worker, clients, scaler, start_failures, now):
+                        # Tube fermé : un tube en fin de fichier reste toujours
+                        # lisible, le retirer de l'attente en attendant reap_workers
+                        close_worker_input(worker)
+                        if worker["state"] not in ("retiring", "terminating"):
+                            worker["state"] = "dead"
+
+        # Arrêter les workers proprement
+        for worker in pool:
+            if worker["fd_out"] is not None and worker["process"].is_alive():
+                try:
+                    print(f"[Dispatcher] - INFO : Envoi de la commande STOP au worker {worker['index']}...")
+                    write_to_worker(worker, "STOP")
+                except OSError:
+                    print(f"{WARNING}Dispatcher - INFO : Worker {worker['index']} déjà arrêté (tube fermé){RESET}")
+
+        # Attendre la fin des workers
+        for worker in pool:
+            stop_worker_process(worker["process"], worker["index"])
 
         print("[Dispatcher] - INFO : Communication terminée")
+        return True
 
     except (BrokenPipeError, OSError) as e:
         if shutdown_requested:
             print(f"{WARNING}[Dispatcher] - INFO : Communication interrompue pendant l'arrêt{RESET}")
-        else:
-            print(f"{ERROR}[Dispatcher] - ERREUR : Erreur de communication (tube cassé): {e}{RESET}")
+            return True
+        print(f"{ERROR}[Dispatcher] - ERREUR : Erreur de communication (tube cassé): {e}{RESET}")
+        return False
     except Exception as e:
-        if not shutdown_requested:
-            print(f"{ERROR}[Dispatcher] - ERREUR : Erreur inattendue dans la communication : {e}{RESET}")
+        if shutdown_requested:
+            return True
+        print(f"{ERROR}[Dispatcher] - ERREUR : Erreur inattendue dans la communication : {e}{RESET}")
+        return False
 
     finally:
-        # Fermeture sécurisée des fichiers
-        for fifo, name in [(fifo_out, "sortie"), (fifo_in, "entrée")]:
-            if fifo:
-                try:
-                    fifo.close()
-                except:
-                    pass
-
-        # Nettoyer les tubes nommés
-        for tube in (TUBE_D_W, TUBE_W_D):
-            try:
-                if os.path.exists(tube):
-                    os.unlink(tube)
-            except:
-                pass
-
-def cleanup_resources(shm_segment, dispatcher_socket, worker_process=None):
+        # Fermeture sécurisée des connexions et des tubes
+        for client_socket in list(clients):
+            close_client(clients, client_socket)
+
+        for worker in pool:
+            close_worker_fds(worker)
+            cleanup_named_pipes(instance, worker["index"])
+
+        selector.close()
+
+def cleanup_resources(shm_segment, dispatcher_socket, pid_file, worker_processes=()):
     """Nettoie les ressources utilisées"""
     print("[Dispatcher] - INFO : Nettoyage des ressources...")
 
-    # Arrêter le worker si nécessaire
-    if worker_process and worker_process.is_alive():
-        print("[Dispatcher] - INFO : Arrêt du processus worker...")
-        worker_process.terminate()
-        worker_process.join(timeout=3)
+    # Arrêter les workers si nécessaire
+    for worker_process in worker_processes:
         if worker_process.is_alive():
-            worker_process.kill()
+            print(f"[Dispatcher] - INFO : Arrêt du processus worker (PID: {worker_process.pid})...")
+            worker_process.terminate()
+            worker_process.join(timeout=3)
+            if worker_process.is_alive():
+                worker_process.kill()
 
     # Nettoyer la mémoire partagée
     if shm_segment:
@@ -240,47 +758,46 @@ def cleanup_resources(shm_segment, dispatcher_socket, worker_process=None):
 
     # Nettoyer les fichiers temporaires
     try:
-        if os.path.exists(DISPATCHER_PID_FILE):
-            os.unlink(DISPATCHER_PID_FILE)
+        if os.path.exists(pid_file):
+            os.unlink(pid_file)
     except:
         pass
 
-def main():
-    """Fonction principale"""
+def main(instance=config.DEFAULT_INSTANCE, port=config.DEFAULT_PORT,
+         min_workers=config.DEFAULT_MIN_WORKERS, max_workers=config.DEFAULT_MAX_WORKERS):
+    """Fonction principale du dispatcher du groupe instance"""
     global shutdown_requested
 
     dispatcher_socket = None
     shm_segment = None
-    worker_process = None
+    pool = []
+    pid_file = config.dispatcher_pid_file(instance)
+
+    # Instrumentation (profilage et traces) pilotable par signal, relayée aux
+    # workers prêts (ceux qui démarrent héritent de l'état du dispatcher)
+    profiler.install("Dispatcher", lambda: [worker["process"].pid for worker in pool if worker["ready"]])
 
     # Écrire le PID dans un fichier
-    with open(DISPATCHER_PID_FILE, "w") as f:
+    with open(pid_file, "w") as f:
         f.write(str(os.getpid()))
 
-    # Configuration des tubes nommés
-    setup_named_pipes()
-
     try:
         # Configuration réseau
-        dispatcher_socket = setup_network()
+        dispatcher_socket = setup_network(port)
         if not dispatcher_socket or shutdown_requested:
             return 1
 
         print('[Dispatcher] - INFO : Début processus 1')
 
         # Configuration de la mémoire partagée
-        shm_segment = setup_shared_memory()
+        shm_segment = setup_shared_memory(instance)
         if not shm_segment or shutdown_requested:
             return 1
 
-        # Lancement du worker
-        worker_process = start_worker_process()
-        if shutdown_requested:
+        # Gérer la communication avec le pool de workers (lancé à la demande)
+        if not handle_worker_communication(instance, port, dispatcher_socket, pool, min_workers, max_workers):
             return 1
 
-        # Gérer la communication avec le worker
-        handle_worker_communication(worker_process)
-
     except KeyboardInterrupt:
         print(f"\n{WARNING}[Dispatcher] - INFO : Interruption clavier détectée{RESET}")
         shutdown_requested = True
@@ -289,10 +806,10 @@ def main():
         return 1
 
     finally:
-        cleanup_resources(shm_segment, dispatcher_socket, worker_process)
+        cleanup_resources(shm_segment, dispatcher_socket, pid_file, [worker["process"] for worker in pool])
 
     print(f"{SUCCESS}[Dispatcher] - INFO : Dispatcher arrêté correctement{RESET}")
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#! /usr/bin/env python3
+# _*_ coding: utf8 _*_
+
+import atexit
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+# --- Constantes ---
+# Couleurs pour les messages
+ERROR = '\033[91m'
+SUCCESS = '\033[92m'
+WARNING = '\033[93m'
+RESET = '\033[0m'
+
+# Signaux de contrôle (temps réel pour ne pas entrer en conflit avec SIGUSR1/SIGUSR2)
+SIGNAL_TOGGLE = signal.SIGRTMIN + 1   # Active / désactive l'instrumentation
+SIGNAL_DUMP = signal.SIGRTMIN + 2     # Écrit le profil et les traces sur disque
+SIGNAL_ENABLE = signal.SIGRTMIN + 3   # Active l'instrumentation (relais vers les processus fils)
+SIGNAL_DISABLE = signal.SIGRTMIN + 4  # Désactive l'instrumentation (relais vers les processus fils)
+
+# Variable d'environnement pour activer l'instrumentation dès le démarrage
+ENV_ENABLED = "OSPS_PROFILE"
+
+# Échantillonnage : intervalle en secondes et horloge ("cpu" ou "wall")
+SAMPLE_INTERVAL = 0.01
+SAMPLE_CLOCK = os.environ.get("OSPS_PROFILE_CLOCK", "cpu")
+
+# Taille maximale du tampon de traces (les plus anciennes sont écrasées)
+TRACE_BUFFER_SIZE = 4096
+
+# Profondeur maximale des piles échantillonnées
+MAX_STACK_DEPTH = 64
+
+# Répertoire de sortie des profils et des traces
+OUTPUT_DIR = "/tmp"
+
+# --- État de l'instrumentation (propre à chaque processus) ---
+process_name = None
+enabled = False
+samples = {}
+traces = deque(maxlen=TRACE_BUFFER_SIZE)
+next_request_id = 0
+
+# Fonction retournant les PID des processus fils auxquels relayer les commandes
+children = None
+
+
+def _timer():
+    """Retourne le couple (timer, signal) correspondant à l'horloge choisie"""
+    if SAMPLE_CLOCK == "wall":
+        return signal.ITIMER_REAL, signal.SIGALRM
+    return signal.ITIMER_PROF, signal.SIGPROF
+
+
+# --- Profileur par échantillonnage ---
+def handle_sample(sig, frame):
+    """Gestionnaire du signal d'échantillonnage : enregistre la pile courante"""
+    stack = []
+    depth = 0
+    while frame is not None and depth < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+        depth += 1
+    key = ";".join(reversed(stack))
+    samples[key] = samples.get(key, 0) + 1
+
+
+def start():
+    """Démarre l'échantillonnage et l'enregistrement des traces"""
+    global enabled
+    if enabled:
+        return
+    timer, timer_signal = _timer()
+    signal.signal(timer_signal, handle_sample)
+    signal.setitimer(timer, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+    enabled = True
+    print(f"{WARNING}[{process_name}] - INFO : Instrumentation activée (PID: {os.getpid()}){RESET}")
+
+
+def stop():
+    """Arrête l'échantillonnage et l'enregistrement des traces"""
+    global enabled
+    if not enabled:
+        return
+    timer, timer_signal = _timer()
+    signal.setitimer(timer, 0)
+    signal.signal(timer_signal, signal.SIG_IGN)
+    enabled = False
+    print(f"{WARNING}[{process_name}] - INFO : Instrumentation désactivée (PID: {os.getpid()}){RESET}")
+
+
+# --- Traces par requête ---
+def new_trace(label, request_id=None, stage="enqueue"):
+    """Crée une trace pour une requête, ou None si l'instrumentation est inactive.
+    request_id permet de retrouver la même requête dans les traces de plusieurs
+    processus ; à défaut un identifiant local est attribué."""
+    global next_request_id
+    if not enabled:
+        return None
+    if request_id is None:
+        next_request_id += 1
+        request_id = next_request_id
+    return [request_id, label, [(stage, time.perf_counter())]]
+
+
+def mark(trace, stage):
+    """Horodate une étape de la requête"""
+    if trace is not None:
+        trace[2].append((stage, time.perf_counter()))
+
+
+def finish(trace):
+    """Range la trace terminée dans le tampon circulaire"""
+    if trace is not None:
+        traces.append(trace)
+
+
+# --- Export ---
+def dump():
+    """Écrit les piles agrégées (format flame graph) et les traces sur disque"""
+    pid = os.getpid()
+    profile_path = os.path.join(OUTPUT_DIR, f"osps-profile-{process_name}-{pid}.folded")
+    trace_path = os.path.join(OUTPUT_DIR, f"osps-trace-{process_name}-{pid}.txt")
+
+    try:
+        with open(profile_path, "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{stack} {count}\n")
+
+        with open(trace_path, "w") as f:
+            for request_id, label, stages in list(traces):
+                start_time = stages[0][1]
+                spans = []
+                previous = start_time
+                for stage, timestamp in stages[1:]:
+                    spans.append(f"{stage}={(timestamp - previous) * 1e6:.0f}us")
+                    previous = timestamp
+                total = (previous - start_time) * 1e6
+                # start : horloge monotone commune aux processus, pour aligner
+                # les traces du dispatcher et du worker d'une même requête
+                f.write(f"{request_id} {label} start={start_time:.6f} {stages[0][0]} "
+                        f"total={total:.0f}us {' '.join(spans)}\n")
+
+        print(f"{SUCCESS}[{process_name}] - SUCCESS : Profil écrit dans {profile_path}, traces dans {trace_path}{RESET}")
+    except OSError as exception:
+        print(f"{ERROR}[{process_name}] - ERREUR : Impossible d'écrire le profil : {exception}{RESET}")
+
+
+# --- Gestion des signaux ---
+def forward(sig):
+    """Relaie une commande aux processus fils déclarés à l'installation"""
+    if children is None:
+        return
+    for pid in children():
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass  # Processus déjà terminé
+
+
+def handle_toggle(sig, frame):
+    """Gestionnaire pour le signal d'activation/désactivation. Les fils
+    reçoivent l'état obtenu plutôt qu'une bascule, pour rester alignés"""
+    if enabled:
+        stop()
+    else:
+        start()
+    forward(SIGNAL_ENABLE if enabled else SIGNAL_DISABLE)
+
+
+def handle_enable(sig, frame):
+    """Gestionnaire pour le signal d'activation"""
+    start()
+    forward(SIGNAL_ENABLE)
+
+
+def handle_disable(sig, frame):
+    """Gestionnaire pour le signal de désactivation"""
+    stop()
+    forward(SIGNAL_DISABLE)
+
+
+def handle_dump(sig, frame):
+    """Gestionnaire pour le signal d'export"""
+    dump()
+    forward(SIGNAL_DUMP)
+
+
+def install(name, child_pids=None):
+    """Installe les gestionnaires de contrôle dans le processus courant.
+    child_pids retourne les PID des processus fils auxquels relayer les commandes"""
+    global process_name, enabled, samples, traces, next_request_id, children
+
+    # Repartir d'un état vierge (l'état du parent est hérité lors d'un fork,
+    # mais pas son timer d'échantillonnage : le relancer si le parent était instrumenté)
+    inherited = enabled
+    process_name = name
+    enabled = False
+    samples = {}
+    traces = deque(maxlen=TRACE_BUFFER_SIZE)
+    next_request_id = 0
+    children = child_pids
+    signal.signal(_timer()[1], signal.SIG_IGN)
+
+    signal.signal(SIGNAL_TOGGLE, handle_toggle)
+    signal.signal(SIGNAL_DUMP, handle_dump)
+    signal.signal(SIGNAL_ENABLE, handle_enable)
+    signal.signal(SIGNAL_DISABLE, handle_disable)
+
+    # Couper le timer avant la finalisation de l'interpréteur
+    atexit.register(stop)
+
+    if inherited or os.environ.get(ENV_ENABLED) == "1":
+        start()
+
+
+# --- Commande de contrôle ---
+def main(argv):
+    """Envoie une commande de contrôle à un processus : toggle|on|off|dump <pid|fichier pid>.
+    Un dispatcher relaie la commande à ses workers"""
+    commands = {"toggle": SIGNAL_TOGGLE, "on": SIGNAL_ENABLE, "off": SIGNAL_DISABLE, "dump": SIGNAL_DUMP}
+
+    if len(argv) != 3 or argv[1] not in commands:
+        print(f"Usage : {argv[0]} toggle|on|off|dump <pid|fichier pid>")
+        return 1
+
+    target = argv[2]
+    try:
+        if os.path.isfile(target):
+            with open(target, "r") as pid_file:
+                target = pid_file.read().strip()
+        pid = int(target)
+        os.kill(pid, commands[argv[1]])
+    except (OSError, ValueError) as exception:
+        print(f"{ERROR}[Profiler] - ERREUR : Impossible de contacter {target} : {exception}{RESET}")
+        return 1
+
+    print(f"{SUCCESS}[Profiler] - SUCCESS : Commande {argv[1]} envoyée au PID {pid}{RESET}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
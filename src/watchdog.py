@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
-import os, time, signal, subprocess
+import os, time, signal, random
 import sys
 from multiprocessing import Process
 
+import config
+import profiler
+
 # --- Constantes ---
 # Couleurs pour les messages
 ERROR = '\033[91m'
@@ -10,37 +13,105 @@ SUCCESS = '\033[92m'
 WARNING = '\033[93m'
 RESET = '\033[0m'
 
-# Variable globale pour le statut des processus
-process_status = {
-    "dispatcher": False,
-    "worker": False
-}
+# Délais de surveillance (en secondes)
+PROBE_INTERVAL = 10     # Intervalle entre deux heartbeats d'un même processus
+REPLY_TIMEOUT = 2       # Délai accordé pour répondre à un heartbeat
+RESTART_DELAY = 1       # Pause avant de relancer un dispatcher arrêté
+DISCOVERY_INTERVAL = 1  # Intervalle de lecture des PID des workers d'un dispatcher relancé
+
+# Roue temporelle : résolution et nombre de cases (horizon = tick * cases)
+WHEEL_TICK = 0.1
+WHEEL_SIZE = 512
+
+# Signaux traités par la boucle d'événements (bloqués puis lus via sigtimedwait)
+WAITED_SIGNALS = {config.HEARTBEAT_REPLY_SIGNAL, signal.SIGCHLD}
+
+
+class TimerWheel:
+    """Roue temporelle hachée : planification et expiration en O(1) par échéance"""
+    __slots__ = ("tick", "slots", "current", "next_tick_at")
+
+    def __init__(self, tick=WHEEL_TICK, size=WHEEL_SIZE):
+        self.tick = tick
+        self.slots = [[] for _ in range(size)]
+        self.current = 0
+        self.next_tick_at = time.monotonic() + tick
+
+    def schedule(self, delay, item):
+        """Planifie item pour expirer dans delay secondes"""
+        ticks = max(1, int(delay / self.tick + 0.999))
+        rounds, _ = divmod(ticks - 1, len(self.slots))
+        slot = (self.current + ticks) % len(self.slots)
+        self.slots[slot].append([rounds, item])
+
+    def advance(self, now):
+        """Fait tourner la roue jusqu'à now et retourne les éléments expirés"""
+        expired = []
+        while now >= self.next_tick_at:
+            self.current = (self.current + 1) % len(self.slots)
+            self.next_tick_at += self.tick
+            bucket = self.slots[self.current]
+            if not bucket:
+                continue
+            remaining = []
+            for entry in bucket:
+                if entry[0] == 0:
+                    expired.append(entry[1])
+                else:
+                    entry[0] -= 1
+                    remaining.append(entry)
+            self.slots[self.current] = remaining
+        return expired
+
+
+class ProcessEntry:
+    """Ligne de la table d'état d'un processus surveillé"""
+    __slots__ = ("group", "role", "index", "pid", "seq", "awaiting", "trace")
+
+    def __init__(self, group, role, index, pid):
+        self.group = group
+        self.role = role
+        self.index = index
+        self.pid = pid
+        self.seq = 0
+        self.awaiting = False
+        self.trace = None
+
+    def label(self):
+        if self.role == "dispatcher":
+            return f"{self.group}/dispatcher"
+        return f"{self.group}/worker {self.index}"
+
 
-def start_dispatcher_process():
-    """Démarre le processus dispatcher"""
+# Variables globales de supervision
+groups = {}          # nom -> {"config": groupe, "process": Process, "workers": {index: pid}}
+process_table = {}   # pid -> ProcessEntry
+wheel = None
+
+
+def run_dispatcher(group):
+    """Point d'entrée du processus dispatcher d'un groupe"""
+    # Le masque de signaux du watchdog est hérité : le rétablir
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, WAITED_SIGNALS)
+
+    # Import dans le processus fils pour ne pas installer les gestionnaires
+    # de signaux du dispatcher dans le watchdog
     from dispatcher import main as dispatcher_main
+    return dispatcher_main(group["name"], group["port"], group["min_workers"], group["max_workers"])
 
+def start_dispatcher_process(group):
+    """Démarre le processus dispatcher d'un groupe"""
     try:
-        print(f"{WARNING}[WATCHDOG] : Démarrage du dispatcher...{RESET}")
-        # Utiliser subprocess au lieu de multiprocessing pour plus de contrôle
-        dispatcher_process = Process(target=dispatcher_main)
+        print(f"{WARNING}[WATCHDOG] : Démarrage du dispatcher {group['name']}...{RESET}")
+        dispatcher_process = Process(target=run_dispatcher, args=(group,))
         dispatcher_process.start()
-        time.sleep(2)  # Laisser le temps au dispatcher de démarrer
-        print(f"{SUCCESS}[WATCHDOG] : Dispatcher démarré (PID: {dispatcher_process.pid}){RESET}")
+        print(f"{SUCCESS}[WATCHDOG] : Dispatcher {group['name']} démarré (PID: {dispatcher_process.pid}){RESET}")
         return dispatcher_process
 
     except Exception as exception:
-        print(f"{ERROR}[WATCHDOG] : Erreur lors du démarrage du dispatcher: {exception}{RESET}")
+        print(f"{ERROR}[WATCHDOG] : Erreur lors du démarrage du dispatcher {group['name']}: {exception}{RESET}")
         return None
 
-def handler_sigusr2(signum, frame):
-    """Gestionnaire pour recevoir SIGUSR2 (OK reçu)"""
-    global process_status
-    # Quand un process répond, on le marque vivant
-    for k in process_status:
-        process_status[k] = True
-    print(f"{SUCCESS}[WATCHDOG] : Signal SIGUSR2 reçu - processus marqués vivants{RESET}")
-
 def is_process_alive(pid):
     """Vérifie si un processus existe"""
     try:
@@ -53,126 +124,221 @@ def is_process_alive(pid):
     except (OSError, ProcessLookupError):
         return False
 
-def get_worker_pid():
-    """Récupère le PID du worker depuis le fichier"""
+def get_worker_pid(name, index):
+    """Récupère le PID d'un worker depuis son fichier"""
     try:
-        with open("/tmp/worker.pid", "r") as worker_pid:
+        with open(config.worker_pid_file(name, index), "r") as worker_pid:
             return int(worker_pid.read().strip())
-    except (FileNotFoundError, ValueError) as exception:
-        print(f"{WARNING}[WATCHDOG] : Impossible de lire le PID du worker: {exception}{RESET}")
+    except (FileNotFoundError, ValueError):
         return None
 
-def main():
-    global process_status
 
-    print(f"{SUCCESS}[WATCHDOG] : Watchdog démarré{RESET}")
+# --- Table d'état ---
+def register_process(name, role, index, pid):
+    """Ajoute un processus à la table et planifie son premier heartbeat"""
+    entry = ProcessEntry(name, role, index, pid)
+    process_table[pid] = entry
+    # Étaler les heartbeats pour ne pas sonder tous les processus en même temps
+    wheel.schedule(REPLY_TIMEOUT + random.uniform(0, PROBE_INTERVAL), ("probe", entry, 0))
+    return entry
+
+def unregister_process(pid):
+    """Retire un processus de la table (ses échéances deviennent caduques)"""
+    process_table.pop(pid, None)
+
+def is_registered(entry):
+    return process_table.get(entry.pid) is entry
 
-    # Configurer le gestionnaire de signal
-    signal.signal(signal.SIGUSR2, handler_sigusr2)
+def discover_workers(name):
+    """Synchronise les workers d'un groupe avec leurs fichiers PID (le pool
+    varie avec l'autoscaling), retourne True si le minimum de workers est connu"""
+    state = groups[name]
+    if state["process"] is None:
+        return True
 
-    # Démarrer le dispatcher
-    dispatcher_process = start_dispatcher_process()
+    for index in range(state["config"]["max_workers"]):
+        pid = get_worker_pid(name, index)
+        known_pid = state["workers"].get(index)
+        if pid == known_pid:
+            continue
+
+        # Worker retiré ou remplacé par le dispatcher
+        if known_pid is not None:
+            unregister_process(known_pid)
+            del state["workers"][index]
+
+        if pid and is_process_alive(pid):
+            state["workers"][index] = pid
+            register_process(name, "worker", index, pid)
+            print(f"{SUCCESS}[WATCHDOG] : Surveillance - {name}/worker {index} PID={pid}{RESET}")
+
+    return len(state["workers"]) >= state["config"]["min_workers"]
+
+
+# --- Actions de supervision ---
+def start_group(name):
+    """(Re)démarre le dispatcher d'un groupe et planifie la découverte des workers"""
+    state = groups[name]
+    dispatcher_process = start_dispatcher_process(state["config"])
     if not dispatcher_process:
-        print(f"{ERROR}[WATCHDOG] : Échec du démarrage du dispatcher{RESET}")
-        return 1
+        wheel.schedule(RESTART_DELAY, ("restart", name))
+        return
 
-    dispatcher_pid = dispatcher_process.pid
+    state["process"] = dispatcher_process
+    register_process(name, "dispatcher", None, dispatcher_process.pid)
+    wheel.schedule(DISCOVERY_INTERVAL, ("discover", name))
 
-    # Attendre que le worker soit lancé
-    print(f"{WARNING}[WATCHDOG] : Attente du démarrage du worker...{RESET}")
-    worker_pid = None
-    for attempt in range(10):  # 10 tentatives
-        worker_pid = get_worker_pid()
-        if worker_pid:
-            break
-        time.sleep(1)
+def stop_group(name, sig=signal.SIGTERM):
+    """Retire un groupe de la table et arrête ses workers orphelins"""
+    state = groups[name]
+    if state["process"] is not None:
+        unregister_process(state["process"].pid)
+        state["process"] = None
 
-    if not worker_pid:
-        print(f"{ERROR}[WATCHDOG] : Worker non trouvé après 10 secondes{RESET}")
+    for index, pid in state["workers"].items():
+        unregister_process(pid)
+        try:
+            os.kill(pid, sig)
+        except (OSError, ProcessLookupError):
+            pass
+    state["workers"] = {}
+
+def check_children():
+    """Détecte les dispatchers terminés (SIGCHLD) et planifie leur relance"""
+    for name, state in groups.items():
+        dispatcher_process = state["process"]
+        if dispatcher_process is None or dispatcher_process.is_alive():
+            continue
+        print(f"{ERROR}[WATCHDOG] : {name}/dispatcher n'existe plus (code {dispatcher_process.exitcode}), redémarrage...{RESET}")
+        stop_group(name)
+        wheel.schedule(RESTART_DELAY, ("restart", name))
+
+def probe(entry):
+    """Envoie un heartbeat à un processus et planifie l'échéance de réponse"""
+    if not is_registered(entry):
+        return
+
+    if entry.role == "dispatcher":
+        discover_workers(entry.group)
+    elif get_worker_pid(entry.group, entry.index) != entry.pid:
+        # Worker retiré par l'autoscaling depuis la dernière découverte
+        unregister_process(entry.pid)
+        if groups[entry.group]["workers"].get(entry.index) == entry.pid:
+            del groups[entry.group]["workers"][entry.index]
+        return
+
+    entry.seq += 1
+    entry.awaiting = True
+    entry.trace = profiler.new_trace(entry.role)
+    try:
+        os.kill(entry.pid, signal.SIGUSR1)
+        profiler.mark(entry.trace, "signal")
+    except (OSError, ProcessLookupError):
+        print(f"{ERROR}[WATCHDOG] : {entry.label()} n'existe plus lors de l'envoi du signal{RESET}")
+        handle_unresponsive(entry)
+        return
+
+    wheel.schedule(REPLY_TIMEOUT, ("deadline", entry, entry.seq))
+    wheel.schedule(PROBE_INTERVAL, ("probe", entry, entry.seq))
+
+def handle_reply(pid):
+    """Marque vivant le processus qui a répondu au heartbeat"""
+    entry = process_table.get(pid)
+    if entry is None or not entry.awaiting:
+        return
+    entry.awaiting = False
+    profiler.mark(entry.trace, "reply")
+    profiler.finish(entry.trace)
+    entry.trace = None
+
+def handle_deadline(entry, seq):
+    """Traite l'expiration du délai de réponse d'un heartbeat"""
+    if not is_registered(entry) or entry.seq != seq or not entry.awaiting:
+        return
+    print(f"{ERROR}[WATCHDOG] {entry.label()} ne répond pas → kill{RESET}")
+    try:
+        os.kill(entry.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        pass
+    handle_unresponsive(entry)
+
+def handle_unresponsive(entry):
+    """Retire un processus mort ou tué de la table"""
+    unregister_process(entry.pid)
+    if entry.role == "dispatcher":
+        # La relance est déclenchée par SIGCHLD une fois le processus récupéré
+        check_children()
+    else:
+        print(f"{WARNING}[WATCHDOG] Laisser {entry.group}/dispatcher relancer worker {entry.index}{RESET}")
+        groups[entry.group]["workers"].pop(entry.index, None)
+
+
+def main(argv=None):
+    global wheel
+
+    argv = sys.argv if argv is None else argv
+
+    print(f"{SUCCESS}[WATCHDOG] : Watchdog démarré{RESET}")
+
+    # Instrumentation (profilage et traces) pilotable par signal
+    profiler.install("WATCHDOG")
+
+    # Charger les groupes à superviser (fichier JSON optionnel en argument)
+    try:
+        group_configs = config.load_groups(argv[1] if len(argv) > 1 else None)
+    except (OSError, ValueError, TypeError) as exception:
+        print(f"{ERROR}[WATCHDOG] : Configuration des groupes invalide : {exception}{RESET}")
         return 1
 
-    print(f"{SUCCESS}[WATCHDOG] : Surveillance - Dispatcher PID={dispatcher_pid}, Worker PID={worker_pid}{RESET}")
+    # Les signaux attendus sont bloqués avant tout fork, puis lus de façon
+    # synchrone : sigtimedwait fournit le PID de l'émetteur de chaque réponse
+    signal.pthread_sigmask(signal.SIG_BLOCK, WAITED_SIGNALS)
+    os.environ[config.ENV_WATCHDOG_PID] = str(os.getpid())
+
+    wheel = TimerWheel()
+    for group in group_configs:
+        groups[group["name"]] = {"config": group, "process": None, "workers": {}}
+        start_group(group["name"])
+
+    print(f"{SUCCESS}[WATCHDOG] : Surveillance de {len(groups)} groupe(s){RESET}")
 
     try:
         while True:
-            # Réinitialiser le statut
-            process_status = {"dispatcher": False, "worker": False}
-
-            for processus, pid in [("dispatcher", dispatcher_pid), ("worker", worker_pid)]:
-                print(f"[WATCHDOG] : Vérification de {processus} (PID: {pid})")
-
-                # Vérifier si le processus existe encore
-                if not is_process_alive(pid):
-                    print(f"{ERROR}[WATCHDOG] : {processus} n'existe plus, redémarrage...{RESET}")
-
-                    if processus == "dispatcher":
-                        dispatcher_process = start_dispatcher_process()
-                        if dispatcher_process:
-                            dispatcher_pid = dispatcher_process.pid
-                            # Récupérer le nouveau PID du worker
-                            time.sleep(2)
-                            worker_pid = get_worker_pid()
-                            if not worker_pid:
-                                print(f"{ERROR}[WATCHDOG] : Nouveau worker non trouvé{RESET}")
-                                continue
-                    else:
-                        print(f"{WARNING}[WATCHDOG] : Worker disparu, le dispatcher le relancera{RESET}")
-                        # Attendre que le dispatcher relance le worker
-                        time.sleep(3)
-                        worker_pid = get_worker_pid()
-
-                    continue
-
-                # Envoyer le signal de test
-                try:
-                    print(f"[WATCHDOG] : Envoi SIGUSR1 à {processus}")
-                    os.kill(pid, signal.SIGUSR1)
-                except (OSError, ProcessLookupError):
-                    print(f"{ERROR}[WATCHDOG] : {processus} n'existe plus lors de l'envoi du signal{RESET}")
-                    continue
-
-                # Attendre la réponse
-                time.sleep(2)
-
-                # Vérifier si le processus a répondu
-                if not process_status[processus]:
-                    print(f"{ERROR}[WATCHDOG] {processus} ne répond pas → kill{RESET}")
-                    try:
-                        os.kill(pid, signal.SIGKILL)
-                        time.sleep(1)
-                    except (OSError, ProcessLookupError):
-                        pass
-
-                    if processus == "dispatcher":
-                        print(f"{WARNING}[WATCHDOG] Relance du dispatcher{RESET}")
-                        dispatcher_process = start_dispatcher_process()
-                        if dispatcher_process:
-                            dispatcher_pid = dispatcher_process.pid
-                            time.sleep(2)
-                            worker_pid = get_worker_pid()
-                    else:
-                        print(f"{WARNING}[WATCHDOG] Laisser dispatcher relancer worker{RESET}")
-                        time.sleep(3)
-                        worker_pid = get_worker_pid()
+            timeout = max(0.0, wheel.next_tick_at - time.monotonic())
+            info = signal.sigtimedwait(WAITED_SIGNALS, timeout)
+            if info is not None:
+                if info.si_signo == config.HEARTBEAT_REPLY_SIGNAL:
+                    handle_reply(info.si_pid)
                 else:
-                    print(f"{SUCCESS}[WATCHDOG] {processus} répond correctement{RESET}")
+                    check_children()
 
-            print(f"{WARNING}[WATCHDOG] Pause de 10 secondes...{RESET}")
-            time.sleep(10)
+            for item in wheel.advance(time.monotonic()):
+                if item[0] == "probe":
+                    if item[1].seq == item[2]:
+                        probe(item[1])
+                elif item[0] == "deadline":
+                    handle_deadline(item[1], item[2])
+                elif item[0] == "discover":
+                    if not discover_workers(item[1]):
+                        wheel.schedule(DISCOVERY_INTERVAL, item)
+                elif item[0] == "restart":
+                    if groups[item[1]]["process"] is None:
+                        start_group(item[1])
 
     except KeyboardInterrupt:
         print(f"\n{WARNING}[WATCHDOG] Arrêt du watchdog demandé{RESET}")
 
         # Arrêter proprement les processus
-        try:
-            if is_process_alive(dispatcher_pid):
-                os.kill(dispatcher_pid, signal.SIGTERM)
-            if worker_pid and is_process_alive(worker_pid):
-                os.kill(worker_pid, signal.SIGTERM)
-        except:
-            pass
+        for name, state in groups.items():
+            dispatcher_process = state["process"]
+            try:
+                if dispatcher_process is not None and dispatcher_process.is_alive():
+                    os.kill(dispatcher_process.pid, signal.SIGTERM)
+            except:
+                pass
+            stop_group(name)
 
         return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
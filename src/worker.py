@@ -2,11 +2,15 @@
 # _*_ coding: utf8 _*_
 
 import os
+import selectors
 import signal
 import socket
 import time
 from multiprocessing import shared_memory
 
+import config
+import profiler
+
 
 # --- Constantes ---
 # Couleurs pour les messages
@@ -17,17 +21,6 @@ RESET = '\033[0m'
 
 # Configuration réseau
 HOST = '127.0.0.1'
-PORT = 2223
-
-# Chemins des tubes nommés
-TUBE_D_W = "/tmp/dwtube1"
-TUBE_W_D = "/tmp/wdtube1"
-
-# Chemin du fichier PID
-WORKER_PID_FILE = "/tmp/worker.pid"
-
-# Configuration mémoire partagée
-SHM_NAME = 'shared_memory'
 
 # Variable globale pour gérer l'arrêt propre
 shutdown_requested = False
@@ -35,8 +28,8 @@ shutdown_requested = False
 
 # --- Gestion des signaux ---
 def handle_sigusr1(sig, frame):
-    """Gestionnaire pour le signal SIGUSR1"""
-    os.kill(os.getppid(), signal.SIGUSR2)
+    """Gestionnaire pour le signal SIGUSR1 (heartbeat du watchdog)"""
+    os.kill(config.heartbeat_target(), config.HEARTBEAT_REPLY_SIGNAL)
 
 def handle_sigint(sig, frame):
     """Gestionnaire pour SIGINT (Ctrl+C)"""
@@ -51,25 +44,25 @@ signal.signal(signal.SIGTERM, handle_sigint)
 
 
 # --- Fonctions utilitaires ---
-def setup_network():
+def setup_network(port):
     """Configure et retourne le socket réseau du worker"""
     try:
         worker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         worker_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        worker_socket.bind((HOST, PORT))
+        worker_socket.bind((HOST, port))
         worker_socket.listen()
-        print(f"[Worker] - INFO : Worker en écoute sur {HOST}:{PORT}")
+        print(f"[Worker] - INFO : Worker en écoute sur {HOST}:{port}")
         return worker_socket
     except OSError as exception:
         print(f"{RED}[Worker] - ERREUR : Une erreur est survenue au moment d'attacher le port : {exception}{RESET}")
-        print(f"{RED}[Worker] - ERREUR : Le port {PORT} est peut-être utilisé par un autre programme{RESET}")
+        print(f"{RED}[Worker] - ERREUR : Le port {port} est peut-être utilisé par un autre programme{RESET}")
         return None
 
 
-def access_shared_memory():
+def access_shared_memory(instance):
     """Accède au segment de mémoire partagée créé par le dispatcher"""
     try:
-        shm_segment = shared_memory.SharedMemory(name=SHM_NAME, create=False)
+        shm_segment = shared_memory.SharedMemory(name=config.shm_name(instance), create=False)
 
         print('[Worker] - INFO : Nom du segment mémoire partagée :', shm_segment.name)
         print('[Worker] - INFO : Taille du segment mémoire partagée en octets :', len(shm_segment.buf))
@@ -81,7 +74,7 @@ def access_shared_memory():
         return None
 
 
-def handle_fifo_communication():
+def handle_fifo_communication(tube_d_w, tube_w_d):
     """Gère la communication via les tubes nommés"""
     global shutdown_requested
 
@@ -89,6 +82,7 @@ def handle_fifo_communication():
 
     fifo_in = None
     fifo_out = None
+    fifo_selector = None
 
     try:
         # Attendre que les tubes soient disponibles
@@ -97,8 +91,8 @@ def handle_fifo_communication():
             if shutdown_requested:
                 return
             try:
-                fifo_in = open(TUBE_D_W, "r")
-                fifo_out = open(TUBE_W_D, "w")
+                fifo_in = open(tube_d_w, "r")
+                fifo_out = open(tube_w_d, "w")
                 break
             except FileNotFoundError:
                 if attempt < max_attempts - 1:
@@ -106,32 +100,69 @@ def handle_fifo_communication():
                 else:
                     raise
 
+        # Sélecteur plutôt que select() : les descripteurs hérités du
+        # dispatcher peuvent dépasser FD_SETSIZE
+        fifo_selector = selectors.DefaultSelector()
+        fifo_selector.register(fifo_in, selectors.EVENT_READ)
+
         while not shutdown_requested:
             try:
                 # Lecture non-bloquante simulée avec un timeout
-                import select
-                ready, _, _ = select.select([fifo_in], [], [], 1.0)
+                ready = fifo_selector.select(1.0)
                 if ready:
-                    msg = fifo_in.readline().strip()
+                    line = fifo_in.readline()
+                    if line == "":
+                        # Fin de fichier : le dispatcher a fermé le tube
+                        print(f"{WARNING}[Worker] - WARNING : Dispatcher déconnecté{RESET}")
+                        break
+
+                    msg = line.strip()
                     if msg == "":
                         continue
 
+                    # Trace rattachée à l'identifiant attribué par le dispatcher
+                    trace = None
+                    if msg.startswith("REQ "):
+                        try:
+                            trace = profiler.new_trace("request", int(msg.split(" ", 2)[1]), "worker_receive")
+                        except (IndexError, ValueError):
+                            pass
+
                     print(f"[Worker] reçoit : {msg}")
 
                     if msg == "STOP":
                         print(f"{WARNING}[Worker] : arrêt demandé{RESET}")
                         break
 
+                    # Commande de contrôle (ping) ou requête encadrée "REQ <id> <contenu>"
                     if msg == "ping":
-                        try:
-                            fifo_out.write("pong\n")
-                            fifo_out.flush()
-                        except (BrokenPipeError, OSError):
-                            if shutdown_requested:
-                                print(f"{WARNING}[Worker] - INFO : Tube fermé pendant l'arrêt{RESET}")
-                            else:
-                                print(f"{WARNING}[Worker] - WARNING : Dispatcher déconnecté{RESET}")
-                            break
+                        reply = "pong"
+                    elif msg.startswith("REQ "):
+                        _, request_id, *payload = msg.split(" ", 2)
+                        payload = payload[0] if payload else ""
+
+                        # Traitement de la requête
+                        if payload == "ping":
+                            result = "pong"
+                        else:
+                            result = f"OK {payload}"
+                        profiler.mark(trace, "handler")
+                        reply = f"REP {request_id} {result}"
+                    else:
+                        print(f"{WARNING}[Worker] - WARNING : Message inconnu ignoré : {msg}{RESET}")
+                        continue
+
+                    try:
+                        fifo_out.write(reply + "\n")
+                        fifo_out.flush()
+                        profiler.mark(trace, "reply")
+                        profiler.finish(trace)
+                    except (BrokenPipeError, OSError):
+                        if shutdown_requested:
+                            print(f"{WARNING}[Worker] - INFO : Tube fermé pendant l'arrêt{RESET}")
+                        else:
+                            print(f"{WARNING}[Worker] - WARNING : Dispatcher déconnecté{RESET}")
+                        break
 
             except (BrokenPipeError, OSError) as e:
                 if shutdown_requested:
@@ -149,6 +180,9 @@ def handle_fifo_communication():
             print(f"{RED}[Worker] - ERREUR : Erreur dans la communication FIFO : {e}{RESET}")
 
     finally:
+        if fifo_selector:
+            fifo_selector.close()
+
         # Fermeture sécurisée des fichiers
         for fifo, name in [(fifo_in, "entrée"), (fifo_out, "sortie")]:
             if fifo:
@@ -158,7 +192,7 @@ def handle_fifo_communication():
                     pass
         print("[Worker] - INFO : Worker terminé")
 
-def cleanup_resources(shm_segment, worker_socket):
+def cleanup_resources(shm_segment, worker_socket, pid_file):
     """Nettoie les ressources utilisées"""
     if shm_segment:
         try:
@@ -176,38 +210,42 @@ def cleanup_resources(shm_segment, worker_socket):
 
     # Nettoyer le fichier PID
     try:
-        if os.path.exists(WORKER_PID_FILE):
-            os.unlink(WORKER_PID_FILE)
+        if os.path.exists(pid_file):
+            os.unlink(pid_file)
     except:
         pass
 
 
-def main():
-    """Fonction principale du worker"""
+def main(instance=config.DEFAULT_INSTANCE, index=0, port=config.worker_port(config.DEFAULT_PORT, 0)):
+    """Fonction principale du worker n°index du groupe instance"""
     global shutdown_requested
 
     worker_socket = None
     shm_segment = None
+    pid_file = config.worker_pid_file(instance, index)
+
+    # Instrumentation (profilage et traces) pilotable par signal
+    profiler.install("Worker")
 
     # Écrire le PID dans un fichier (pour watchdog)
-    with open(WORKER_PID_FILE, "w") as f:
+    with open(pid_file, "w") as f:
         f.write(str(os.getpid()))
 
     try:
         # Configuration réseau
-        worker_socket = setup_network()
+        worker_socket = setup_network(port)
         if not worker_socket or shutdown_requested:
             return 1
 
         print('Worker - INFO : Début processus 2')
 
         # Accès à la mémoire partagée
-        shm_segment = access_shared_memory()
+        shm_segment = access_shared_memory(instance)
         if not shm_segment or shutdown_requested:
             return 1
 
         # Gestion de la communication FIFO
-        handle_fifo_communication()
+        handle_fifo_communication(*config.tube_paths(instance, index))
 
         print('[Worker] : Fin processus 2')
 
@@ -219,7 +257,7 @@ def main():
         return 1
 
     finally:
-        cleanup_resources(shm_segment, worker_socket)
+        cleanup_resources(shm_segment, worker_socket, pid_file)
 
     print(f"{SUCCESS}[Worker] - SUCCESS : Worker terminé{RESET}")
     return 0